@@ -1,16 +1,15 @@
 def getattr_or_keyval(obj, attrs=None, keys=None):
-    if obj is None:
-        return None
     if attrs is None:
         attrs = []
     if keys is None:
         keys = []
     for attr in attrs:
-        try:
-            obj = getattr(obj, attr, None)
-        except AttributeError:
+        if obj is None:
             return None
+        obj = getattr(obj, attr, None)
     for key in keys:
+        if obj is None:
+            return None
         try:
             obj = obj[key]
         except KeyError:
@@ -19,20 +18,19 @@ def getattr_or_keyval(obj, attrs=None, keys=None):
 
 
 def getattrs(obj, *attrs):
-    if obj is None:
-        return None
     for attr in attrs:
-        try:
-            obj = getattr(obj, attr, None)
-        except AttributeError:
+        if obj is None:
             return None
+        obj = getattr(obj, attr, None)
     return obj
 
 
 def getkeyvals(obj, *keys):
-    if obj is None or not isinstance(obj, dict):
+    if not isinstance(obj, dict):
         return None
     for key in keys:
+        if obj is None:
+            return None
         try:
             obj = obj[key]
         except KeyError:
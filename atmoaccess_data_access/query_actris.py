@@ -1,18 +1,111 @@
 import warnings
 import io
+import json
+import importlib.resources
+import sys
+import time
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter, Retry
 from requests.exceptions import HTTPError
 import pandas as pd
 import xarray as xr
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
 REST_URL_PATH = "https://prod-actris-md2.nilu.no/"
 REST_URL_STATIONS = REST_URL_PATH + "facilities"
 REST_URL_VARIABLES = REST_URL_PATH + "vocabulary/contentattribute"
 REST_URL_DOWNLOAD = REST_URL_PATH + "metadata/"
 
-STATIC_PARAMETERS = ["latitude", "longitude", "air_pressure", "barometric_altitude"]
+STATIC_PARAMETERS = frozenset(["latitude", "longitude", "air_pressure", "barometric_altitude"])
+
+# protocols of distribution entries exposed as dataset urls
+_ALLOWED_PROTOCOLS = frozenset(('OPeNDAP', 'HTTP'))
+
+# upper bound on the total number of HTTP requests in flight at once, counting
+# the page fetches spawned per station worker
+_MAX_CONCURRENT_REQUESTS = 32
+
+# upper bound on speculative page fetches issued in parallel for a single station
+_MAX_CONCURRENT_PAGES = 8
+
+# shared session so that all ACTRIS traffic reuses pooled keep-alive connections
+# instead of paying a TCP+TLS handshake per request; transient server errors are
+# retried with exponential backoff instead of aborting a whole multi-page query
+_session = requests.Session()
+_session.mount('https://', HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=64,
+    max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 502, 503, 504], allowed_methods=['GET']),
+))
+# the metadata payloads are highly compressible JSON; make the accepted encodings
+# explicit in case an intermediary strips the defaults. brotli is only advertised
+# when a decoder is importable (mirroring urllib3), as the server would otherwise
+# send 'br' bodies that urllib3 cannot decode
+_session.headers.update({
+    'Accept': 'application/json',
+    'Accept-Encoding': 'gzip, deflate, br' if brotli is not None else 'gzip, deflate',
+})
+
+# the facilities and vocabulary catalogs are essentially static; keep them in an
+# in-process cache for this long (in seconds)
+_CATALOG_EXPIRE_TIME = 3600
+_catalog_cache = {}
+
+# per-station metadata changes more often than the catalogs; cache the page walks
+# with a shorter TTL (in seconds)
+_METADATA_EXPIRE_TIME = 300
+_station_cache = {}
+
+def _load_mapping_ecv_actris():
+    """
+    Load the ECV -> ACTRIS variables mapping from the packaged JSON resource; keeping the
+    multi-hundred-entry mapping out of the module source avoids compiling a huge dict
+    literal on every import.
+    """
+    data = importlib.resources.files(__package__).joinpath('data/mapping_ecv_actris.json').read_bytes()
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+MAPPING_ECV_ACTRIS = _load_mapping_ecv_actris()
+
+def _json(response):
+    """
+    Decode the JSON body of a REST response, with orjson when available (it parses the
+    object-heavy ACTRIS metadata payloads several times faster than the stdlib parser).
+    """
+    if orjson is not None:
+        return orjson.loads(response.content)
+    return response.json()
+
+
+def _catalog_get(url):
+    """
+    Fetch a catalog endpoint, serving repeated calls from the in-process TTL cache.
+    """
+    now = time.monotonic()
+    cached = _catalog_cache.get(url)
+    if cached is not None and now - cached[0] < _CATALOG_EXPIRE_TIME:
+        return cached[1]
+    response = _session.get(url)
+    response.raise_for_status()
+    data = _json(response)
+    _catalog_cache[url] = (now, data)
+    return data
 
-MAPPING_ECV_ACTRIS = {'Aerosol Optical Properties': ['aerosol particle light absorption coefficient', 'aerosol particle backscatter coefficient', 'aerosol particle light extinction coefficient', 'aerosol particle light hemispheric backscatter coefficient', 'aerosol particle light scattering coefficient', 'aerosol particle optical depth'], 'Aerosol Chemical Properties': ['aerosol particle aluminium mass concentration', 'aerosol particle ammonium mass concentration', 'aerosol particle arsenic mass concentration', 'aerosol particle barium mass concentration', 'aerosol particle bromine mass concentration', 'aerosol particle cadmium mass concentration', 'aerosol particle calcium mass concentration', 'aerosol particle carbonate carbon mass concentration', 'aerosol particle carbon mass concentration', 'aerosol particle chloride mass concentration', 'aerosol particle chlorine mass concentration', 'aerosol particle chromium mass concentration', 'aerosol particle cobalt mass concentration', 'aerosol particle copper mass concentration', 'aerosol particle elemental carbon mass concentration', 'aerosol particle equivalent black carbon mass concentration', 'aerosol particle iron mass concentration', 'aerosol particle lead mass concentration', 'aerosol particle magnesium mass concentration', 'aerosol particle manganese mass concentration', 'aerosol particle mass concentration', 'aerosol particle mercury mass concentration', 'aerosol particle molybdenum mass concentration', 'aerosol particle nickel mass concentration', 'aerosol particle nitrate mass concentration', 'aerosol particle organic carbon mass concentration', 'aerosol particle organics mass concentration', 'aerosol particle phosphorus mass concentration', 'aerosol particle potassium mass concentration', 'aerosol particle rubidium mass concentration', 'aerosol particle scandium mass concentration', 'aerosol particle selenium mass concentration', 'aerosol particle silicon mass concentration', 'aerosol particle sodium mass concentration', 'aerosol particle strontium mass concentration', 'aerosol particle sulfur mass concentration', 'aerosol particle titanium mass concentration', 'aerosol particle total carbon mass concentration', 'aerosol particle vanadium mass concentration', 'aerosol particle zinc mass concentration', 'aerosol particle zirconium mass concentration', 'aerosol particle sulphate mass concentration', 'aerosol particle iron 57 mass concentration', 'aerosol particle benzo(b)naphtho(2,1-d)thiophene mass concentration', 'aerosol particle levoglucosan mass concentration', 'aerosol particle indeno(1,2,3-cd)pyrene mass concentration', 'aerosol particle octabromo-1,3,3-trimethyl-1-phenylindane mass concentration', 'aerosol particle 1,2,3,4,5-pentabromobenzene mass concentration', 'aerosol particle dechlorane plus anti mass concentration', 'aerosol particle benzo(c)phenanthrene mass concentration', 'aerosol particle benzo(e)pyrene mass concentration', 'aerosol particle benzo(ghi)perylene mass concentration', 'aerosol particle benzo(j)fluoranthene mass concentration', 'aerosol particle benzo(k)fluoranthene mass concentration', 'aerosol particle (Z)-nonachlor mass concentration', 'aerosol particle cyclopenta(cd)pyrene mass concentration', 'aerosol particle methanesulfonate mass concentration', 'aerosol particle dechlorane plus syn mass concentration', 'aerosol particle PCB 1 mass concentration', 'aerosol particle PCB 101 mass concentration', 'aerosol particle PCB 105 mass concentration', 'aerosol particle PCB 110 mass concentration', 'aerosol particle PCB 114 mass concentration', 'aerosol particle PCB 118 mass concentration', 'aerosol particle PCB 119 mass concentration', 'aerosol particle PCB 123 mass concentration', 'aerosol particle PCB 126 mass concentration', 'aerosol particle PCB 128 mass concentration', 'aerosol particle PCB 131 mass concentration', 'aerosol particle PCB 132 mass concentration', 'aerosol particle PCB 134 mass concentration', 'aerosol particle PCB 136 mass concentration', 'aerosol particle PCB 137 mass concentration', 'aerosol particle PCB 138 mass concentration', 'aerosol particle PCB 141 mass concentration', 'aerosol particle PCB 146 mass concentration', 'aerosol particle PCB 149 mass concentration', 'aerosol particle PCB 15 mass concentration', 'aerosol particle PCB 151 mass concentration', 'aerosol particle PCB 153 mass concentration', 'aerosol particle PCB 156 mass concentration', 'aerosol particle PCB 157 mass concentration', 'aerosol particle PCB 158 mass concentration', 'aerosol particle PCB 167 mass concentration', 'aerosol particle PCB 169 mass concentration', 'aerosol particle PCB 17 mass concentration', 'aerosol particle PCB 170 mass concentration', 'aerosol particle PCB 171 mass concentration', 'aerosol particle PCB 174 mass concentration', 'aerosol particle PCB 175 mass concentration', 'aerosol particle PCB 177 mass concentration', 'aerosol particle PCB 178 mass concentration', 'aerosol particle PCB 179 mass concentration', 'aerosol particle PCB 18 mass concentration', 'aerosol particle PCB 180 mass concentration', 'aerosol particle PCB 183 mass concentration', 'aerosol particle PCB 185 mass concentration', 'aerosol particle PCB 187 mass concentration', 'aerosol particle PCB 188 mass concentration', 'aerosol particle PCB 189 mass concentration', 'aerosol particle PCB 19 mass concentration', 'aerosol particle PCB 191 mass concentration', 'aerosol particle PCB 193 mass concentration', 'aerosol particle PCB 194 mass concentration', 'aerosol particle PCB 195 mass concentration', 'aerosol particle PCB 198 mass concentration', 'aerosol particle PCB 199 mass concentration', 'aerosol particle PCB 200 mass concentration', 'aerosol particle PCB 201 mass concentration', 'aerosol particle PCB 202 mass concentration', 'aerosol particle PCB 205 mass concentration', 'aerosol particle PCB 206 mass concentration', 'aerosol particle PCB 207 mass concentration', 'aerosol particle PCB 208 mass concentration', 'aerosol particle PCB 209 mass concentration', 'aerosol particle PCB 22 mass concentration', 'aerosol particle PCB 25 mass concentration', 'aerosol particle PCB 26 mass concentration', 'aerosol particle PCB 28 mass concentration', 'aerosol particle PCB 3 mass concentration', 'aerosol particle PCB 31 mass concentration', 'aerosol particle PCB 33 mass concentration', 'aerosol particle PCB 37 mass concentration', 'aerosol particle PCB 40 mass concentration', 'aerosol particle PCB 42 mass concentration', 'aerosol particle PCB 44 mass concentration', 'aerosol particle PCB 45 mass concentration', 'aerosol particle PCB 46 mass concentration', 'aerosol particle PCB 47 mass concentration', 'aerosol particle PCB 48 mass concentration', 'aerosol particle PCB 49 mass concentration', 'aerosol particle PCB 52 mass concentration', 'aerosol particle PCB 6 mass concentration', 'aerosol particle PCB 64 mass concentration', 'aerosol particle PCB 66 mass concentration', 'aerosol particle PCB 7 mass concentration', 'aerosol particle PCB 70 mass concentration', 'aerosol particle PCB 74 mass concentration', 'aerosol particle PCB 77 mass concentration', 'aerosol particle PCB 8 mass concentration', 'aerosol particle PCB 81 mass concentration', 'aerosol particle PCB 82 mass concentration', 'aerosol particle PCB 83 mass concentration', 'aerosol particle PCB 85 mass concentration', 'aerosol particle PCB 87 mass concentration', 'aerosol particle PCB 91 mass concentration', 'aerosol particle PCB 95 mass concentration', 'aerosol particle PCB 97 mass concentration', 'aerosol particle PCB 99 mass concentration', 'aerosol particle carbonate mass concentration', 'aerosol particle benzo(b)triphenylene mass concentration', 'aerosol particle dibenzo(a,e)pyrene mass concentration', 'aerosol particle dibenz(a,h)anthracene mass concentration', 'aerosol particle dibenzo(a,h)pyrene mass concentration', 'aerosol particle dibenzo(a,i)pyrene mass concentration', 'aerosol particle dibenzo(a,l)pyrene mass concentration', 'aerosol particle dibenzothiophene mass concentration', 'aerosol particle galactosan mass concentration', 'aerosol particle gamma-hexachlorocyclohexane mass concentration', 'aerosol particle glucose mass concentration', 'aerosol particle heptachlor mass concentration', 'aerosol particle heptachlor epoxide mass concentration', 'aerosol particle indene mass concentration', 'aerosol particle indeno(1,2,3-cd)perylene mass concentration', 'aerosol particle hexahydroxycyclohexane mass concentration', 'aerosol particle myo-inositol mass concentration', 'aerosol particle mannose mass concentration', 'aerosol particle methanesulfonic acid mass concentration', 'aerosol particle acer pollen number concentration', 'aerosol particle alnus pollen number concentration', 'aerosol particle amaranthaceae pollen number concentration', 'aerosol particle ambrosia pollen number concentration', 'aerosol particle artemisia pollen number concentration', 'aerosol particle betula pollen number concentration', 'aerosol particle broussonetia pollen number concentration', 'aerosol particle carpinus pollen number concentration', 'aerosol particle castanea pollen number concentration', 'aerosol particle casuarina pollen number concentration', 'aerosol particle corylus pollen number concentration', 'aerosol particle cryptomeria pollen number concentration', 'aerosol particle cupressaceae pollen number concentration', 'aerosol particle fagus pollen number concentration', 'aerosol particle fraxinus pollen number concentration', 'aerosol particle morus pollen number concentration', 'aerosol particle olea pollen number concentration', 'aerosol particle ostrya pollen number concentration', 'aerosol particle picea pollen number concentration', 'aerosol particle pinaceae pollen number concentration', 'aerosol particle plantago pollen number concentration', 'aerosol particle platanus pollen number concentration', 'aerosol particle poaceae pollen number concentration', 'aerosol particle populus pollen number concentration', 'aerosol particle quercus pollen number concentration', 'aerosol particle rumex pollen number concentration', 'aerosol particle salix pollen number concentration', 'aerosol particle total pollen number concentration', 'aerosol particle ulmus pollen number concentration', 'aerosol particle urticaceae pollen number concentration', 'aerosol particle 1,2,3,4-tetrachlorobenzene mass concentration', 'aerosol particle tetralin mass concentration', 'aerosol particle 1,2,3-trichlorobenzene mass concentration', 'aerosol particle 1,2,4,5-tetrachlorobenzene mass concentration', 'aerosol particle 1,2,4-trichlorobenzene mass concentration', 'aerosol particle 1,2-dichlorobenzene mass concentration', 'aerosol particle 1,3,5-trichlorobenzene mass concentration', 'aerosol particle 1,3-dichlorobenzene mass concentration', 'aerosol particle 1,4-dichlorobenzene mass concentration', 'aerosol particle 1-methylnaphthalene mass concentration', 'aerosol particle 1,2,3,4,6,7,8-heptachlorodibenzo-p-dioxin mass concentration', 'aerosol particle 1,2,3,4,6,7,8-heptachlorodibenzofuran mass concentration', 'aerosol particle 1,2,3,4,7,8,9-heptachlorodibenzofuran mass concentration', 'aerosol particle 1,2,3,4,7,8-hexachlorodibenzo-p-dioxin mass concentration', 'aerosol particle 1,2,3,4,7,8-hexachlorodibenzofuran mass concentration', 'aerosol particle 1,2,3,6,7,8-hexachlorodibenzo-p-dioxin mass concentration', 'aerosol particle 1,2,3,6,7,8-hexachlorodibenzofuran mass concentration', 'aerosol particle 1,2,3,7,8,9-hexachlorodibenzo-p-dioxin mass concentration', 'aerosol particle 1,2,3,7,8,9-hexachlorodibenzofuran mass concentration', 'aerosol particle 1,2,3,7,8-pentachlorodibenzo-p-dioxin mass concentration', 'aerosol particle 1,2,3,7,8-pentachlorodibenzofuran mass concentration', 'aerosol particle 2-chloronaphthalene mass concentration', 'aerosol particle 2-methylerythritol mass concentration', 'aerosol particle 2-methylnaphthalene mass concentration', 'aerosol particle 2-methylthreitol mass concentration', 'aerosol particle 2,3,4,6,7,8-hexachlorodibenzofuran mass concentration', 'aerosol particle 2,3,4,7,8-pentachlorodibenzofuran mass concentration', 'aerosol particle 2,3,7,8-tetrachlorodibenzo-p-dioxin mass concentration', 'aerosol particle 2,3,7,8-tetrachlorodibenzofuran mass concentration', 'aerosol particle 5-methylchrysene mass concentration', 'aerosol particle allyl 2,4,6-tribromophenyl ether mass concentration', 'aerosol particle 2-bromoallyl-2,4,6-tribromophenyl ether mass concentration', "aerosol particle 2,2',4,5,5'-pentabromobiphenyl mass concentration", "aerosol particle 2,2',4,4',6-pentabromodiphenyl ether mass concentration", "aerosol particle 2,3',4,4',6-pentabromodiphenyl ether mass concentration", "aerosol particle 3,3',4,4',5-pentabromodiphenyl ether mass concentration", "aerosol particle 2,2',3,4,4',5'-hexabromodiphenyl ether mass concentration", "aerosol particle 4,4'-dibromodiphenyl ether mass concentration", "aerosol particle 2,2',4,4',5,5'-hexabromodiphenyl ether mass concentration", "aerosol particle 2,2',4,4',5,6'-hexabromodiphenyl ether mass concentration", 'aerosol particle hexabromodiphenyl ether mass concentration', "aerosol particle 2,3,3',4,4',5-hexabromodiphenyl ether mass concentration", "aerosol particle 2,3,4,4',5,6-hexabromodiphenyl ether mass concentration", "aerosol particle 2,2',4-tribromodiphenyl ether mass concentration", "aerosol particle 2,2',3,4,4',5',6-heptabromodiphenyl ether mass concentration", "aerosol particle 2,2',3,4,4',6,6'-heptabromodiphenyl ether mass concentration", "aerosol particle 2,3,3',4,4',5,6-heptabromodiphenyl ether mass concentration", "aerosol particle 2,3,3',4,4',5',6-heptabromodiphenyl ether mass concentration", "aerosol particle 2,2',3,3',4,4',6,6'-octabromodiphenyl ether mass concentration", "aerosol particle 2,2',3,3',5,5',6,6'-octabromodiphenyl ether mass concentration", "aerosol particle 2,2',3,4,4',5,5',6-octabromodiphenyl ether mass concentration", "aerosol particle 2,3,3',4,4',5,5',6-octabromodiphenyl ether mass concentration", 'aerosol particle nonabromodiphenyl ether mass concentration', "aerosol particle 2,2',3,3',4,4',5,6,6'-nonabromodiphenyl ether mass concentration", 'aerosol particle decabromodiphenyl ether mass concentration', "aerosol particle 2,4,4'-tribromodiphenyl ether mass concentration", "aerosol particle 2,2',4,4'-tetrabromodiphenyl ether mass concentration", "aerosol particle 2,2',4,5'-tetrabromodiphenyl ether mass concentration", "aerosol particle 2,3',4,4'-tetrabromodiphenyl ether mass concentration", 'aerosol particle 2,4-dibromodiphenyl ether mass concentration', "aerosol particle 2,3',4',6-tetrabromodiphenyl ether mass concentration", "aerosol particle 2,2',3,4,4'-pentabromodiphenyl ether mass concentration", "aerosol particle 2,2',4,4',5-pentabromodiphenyl ether mass concentration", 'aerosol particle bis(2-ethylhexyl) tetrabromophthalate mass concentration', 'aerosol particle 2,3-dibromopropyl-2,4,6-tribromophenyl ether mass concentration', 'aerosol particle hexabromobenzene mass concentration', 'aerosol particle hexabromocyclododecane mass concentration', 'aerosol particle hexachlorobenzene mass concentration', 'aerosol particle hexachlorobutadiene mass concentration', 'aerosol particle octachlorodibenzo-p-dioxin mass concentration', 'aerosol particle octachlorodibenzofuran mass concentration', 'aerosol particle pentabromobenzyl acrylate mass concentration', 'aerosol particle pentabromoethylbenzene mass concentration', 'aerosol particle pentabromotoluene mass concentration', 'aerosol particle acenaphthene mass concentration', 'aerosol particle acenaphthylene mass concentration', 'aerosol particle anthanthrene mass concentration', 'aerosol particle anthracene mass concentration', 'aerosol particle benzanthracene mass concentration', 'aerosol particle benzo(a)pyrene mass concentration', 'aerosol particle benz(e)acephenanthrylene mass concentration', 'aerosol particle 1,2-dihydrobenz(j)aceanthrylene mass concentration', 'aerosol particle chrysene mass concentration', 'aerosol particle chrysene triphenylene mass concentration', 'aerosol particle coronene mass concentration', 'aerosol particle fluoranthene mass concentration', 'aerosol particle fluorene mass concentration', 'aerosol particle naphthalene mass concentration', 'aerosol particle perylene mass concentration', 'aerosol particle phenanthrene mass concentration', 'aerosol particle pyrene mass concentration', 'aerosol particle retene mass concentration', 'aerosol particle beta-hexachlorocyclohexane mass concentration', 'aerosol particle beta-endosulfan mass concentration', 'aerosol particle dieldrin mass concentration', 'aerosol particle endosulfan mass concentration', 'aerosol particle endrin mass concentration', 'aerosol particle methoxychlor mass concentration', 'aerosol particle mirex mass concentration', 'aerosol particle oxychlordane mass concentration', 'aerosol particle 2,3,5,6-tetrabromo-p-xylene mass concentration', 'aerosol particle p,p-DDD mass concentration', 'aerosol particle p,p-DDE mass concentration', 'aerosol particle p,p-DDT mass concentration', 'aerosol particle (E)-chlordane mass concentration', 'aerosol particle (E)-nonachlor mass concentration', 'aerosol particle formate mass concentration', 'aerosol particle oxalate mass concentration', 'aerosol particle acetate mass concentration', 'aerosol particle ammonium nitrate mass concentration', 'aerosol particle bromide mass concentration', 'aerosol particle fluoride mass concentration', 'aerosol particle iodide mass concentration', 'aerosol particle nitrite mass concentration', 'aerosol particle aldrin mass concentration', 'aerosol particle tetrabromo-o-chlorotoluene mass concentration', 'aerosol particle pentachloroanisole mass concentration', 'aerosol particle pentachlorobenzene mass concentration', 'aerosol particle alpha-hexachlorocyclohexane mass concentration', 'aerosol particle alpha-endosulfan mass concentration', 'aerosol particle (Z)-chlordane mass concentration', 'aerosol particle octachlorostyrene mass concentration', 'aerosol particle tetrachloroveratrole mass concentration', 'aerosol particle trichloroveratrole mass concentration', 'aerosol particle trifluralin mass concentration', 'aerosol particle beryllium mass concentration', 'aerosol particle bismuth mass concentration', 'aerosol particle antimony mass concentration', 'aerosol particle cerium mass concentration', 'aerosol particle cesium mass concentration', 'aerosol particle dysprosium mass concentration', 'aerosol particle erbium mass concentration', 'aerosol particle europium mass concentration', 'aerosol particle gadolinium mass concentration', 'aerosol particle gallium mass concentration', 'aerosol particle germanium mass concentration', 'aerosol particle hafnium mass concentration', 'aerosol particle holmium mass concentration', 'aerosol particle lanthanum mass concentration', 'aerosol particle lithium mass concentration', 'aerosol particle lutetium mass concentration', 'aerosol particle neodymium mass concentration', 'aerosol particle niobium mass concentration', 'aerosol particle praseodymium mass concentration', 'aerosol particle ruthenium mass concentration', 'aerosol particle samarium mass concentration', 'aerosol particle tantalum mass concentration', 'aerosol particle terbium mass concentration', 'aerosol particle thallium mass concentration', 'aerosol particle thorium mass concentration', 'aerosol particle thulium mass concentration', 'aerosol particle tin mass concentration', 'aerosol particle tungsten mass concentration', 'aerosol particle uranium mass concentration', 'aerosol particle ytterbium mass concentration', 'aerosol particle yttrium mass concentration', 'aerosol particle photomirex mass concentration', 'aerosol particle cellulose mass concentration', 'aerosol particle fructose mass concentration', 'aerosol particle sucrose mass concentration', 'aerosol particle trehalose mass concentration', 'aerosol particle arabitol mass concentration', 'aerosol particle erythritol mass concentration', 'aerosol particle o,p-DDD mass concentration', 'aerosol particle o,p-DDE mass concentration', 'aerosol particle o,p-DDT mass concentration', 'aerosol particle mineral dust mass concentration', 'aerosol particle phosphate mass concentration', 'aerosol particle mannitol mass concentration', 'aerosol particle mannosan mass concentration', 'aerosol particle PCB 130 and PCB 176 mass concentration', 'aerosol particle PCB 144 and PCB 135 mass concentration', 'aerosol particle PCB 16 and PCB 32 mass concentration', 'aerosol particle PCB 17 and PCB 18 mass concentration', 'aerosol particle PCB 172 and PCB 197 mass concentration', 'aerosol particle PCB 178 and PCB 129 mass concentration', 'aerosol particle PCB 196 and PCB 203 mass concentration', 'aerosol particle PCB 201 and PCB 157 mass concentration', 'aerosol particle PCB 24 and PCB 27 mass concentration', 'aerosol particle PCB 28 and PCB 31 mass concentration', 'aerosol particle PCB 4 and PCB 10 mass concentration', 'aerosol particle PCB 41 and PCB 71 mass concentration', 'aerosol particle PCB 56 and PCB 60 mass concentration', 'aerosol particle PCB 70 and PCB 60 mass concentration', 'aerosol particle PCB 70 and PCB 76 mass concentration', 'aerosol particle PCB 8 and PCB 5 mass concentration', 'aerosol particle PCB 84 and PCB 89 mass concentration', 'aerosol particle dibenzo(ac,ah)anthracenes mass concentration', 'aerosol particle PBDE 25 and PBDE 28 mass concentration', 'aerosol particle PBDE 85 and PBDE 126 mass concentration', 'aerosol particle benz(bj)fluoranthenes mass concentration', 'aerosol particle benz(bjk)fluoranthenes mass concentration', 'aerosol particle benz(bk)fluoranthenes mass concentration', 'aerosol particle benz(jk)fluoranthenes mass concentration', 'aerosol particle volatile mass concentration', 'aerosol particle non-volatile mass concentration', 'aerosol particle hydrogen ion mass concentration', 'aerosol particle positive ion mass concentration'], 'Aerosol Physical Properties': ['aerosol particle number concentration', 'cloud condensation nuclei number concentration', 'aerosol particle nano number concentration', 'aerosol particle fine-mode number concentration', 'aerosol particle number size distribution', 'cloud condensation nuclei number size distribution', 'aerosol particle fine-mode number size distribution', 'aerosol particle nano number size distribution', 'naturally negatively charged nano aerosol particle number size distribution', 'naturally positively charged nano aerosol particle number size distribution', 'aerosol particle volatile number size distribution', 'aerosol particle non-volatile number size distribution'], 'NO2': ['nitrogen dioxide amount fraction', 'nitrogen dioxide mass concentration', 'nitrogen dioxide number concentration']}
 
 def _reverse_mapping(mapping):
     ret = {}
@@ -26,6 +119,17 @@ def _reverse_mapping(mapping):
 
 MAPPING_ACTRIS_ECV = _reverse_mapping(MAPPING_ECV_ACTRIS)
 
+# freeze the reverse mapping: tuple values are immutable and shareable, and interned
+# strings let the hot attribute lookups and set operations compare by pointer
+MAPPING_ACTRIS_ECV = {
+    sys.intern(key): tuple(sys.intern(value) for value in values)
+    for key, values in MAPPING_ACTRIS_ECV.items()
+}
+
+# frozenset-valued view of MAPPING_ACTRIS_ECV so that hot loops can run set-disjointness
+# tests without rebuilding a set per lookup
+MAPPING_ACTRIS_ECV_SETS = {key: frozenset(values) for key, values in MAPPING_ACTRIS_ECV.items()}
+
 def get_list_platforms():
     """
     Retrieves a list of ACTRIS facilities (ACTRIS National Facility - In Progress):
@@ -37,26 +141,18 @@ def get_list_platforms():
     :return: list of dict
     """
     try:
-        response = requests.get(REST_URL_STATIONS)
-        response.raise_for_status()
-
-        all_facilities = []
-
-        for facility in response.json():
-                
-                if facility.get('actris_national_facility') == True:
-                    all_facilities.append(
-                        {
-                            'short_name': facility['identifier'],
-                            'latitude': facility['lat'],
-                            'longitude': facility['lon'],
-                            'long_name': facility['name'],
-                            'URI': '{0}/facilities/{1}'.format(REST_URL_PATH, facility['identifier']),
-                            'altitude': facility['alt']})
-                else:
-                    pass
-
-        return all_facilities
+        return [
+            {
+                'short_name': facility['identifier'],
+                'latitude': facility['lat'],
+                'longitude': facility['lon'],
+                'long_name': facility['name'],
+                'URI': f"{REST_URL_PATH}/facilities/{facility['identifier']}",
+                'altitude': facility['alt'],
+            }
+            for facility in _catalog_get(REST_URL_STATIONS)
+            if facility.get('actris_national_facility')
+        ]
 
     except HTTPError as http_err:
         warnings.warn(f'HTTP error occurred: {http_err}')
@@ -77,15 +173,13 @@ def get_list_variables():
     :return: list of dict
     """
     try:
-        response = requests.get(REST_URL_VARIABLES)
-        response.raise_for_status()
-        jsonResponse = response.json()
+        jsonResponse = _catalog_get(REST_URL_VARIABLES)
         variables = []
         for item in jsonResponse:
             if item['label'] in MAPPING_ACTRIS_ECV:
                 variable = {
                     'variable_name': item['label'],
-                    'ECV_name': MAPPING_ACTRIS_ECV[item['label']]
+                    'ECV_name': list(MAPPING_ACTRIS_ECV[item['label']])
                 }
                 variables.append(variable)
         return variables
@@ -97,77 +191,157 @@ def get_list_variables():
         warnings.warn(f'Other error occurred: {err}')
         raise
 
-def query_datasets_stations(codes, variables_list=None, temporal_extent=None):
+@functools.lru_cache(maxsize=4096)
+def _ecvs_for(attribute_descriptions):
     """
-    Query the ACTRIS database for metadata of datasets satisfying the specified criteria.
+    Map a frozenset of ACTRIS attribute descriptions to the frozenset of corresponding
+    ECV names; memoized, since many datasets repeat the same attribute sets.
     """
-    all_datasets = []
+    ecvs = set()
+    for attribute in attribute_descriptions:
+        ecvs.update(MAPPING_ACTRIS_ECV.get(attribute, ()))
+    return frozenset(ecvs)
+
 
-    for code in codes:
-        page = 0
+def _fetch_page(code, page):
+    """
+    Fetch a single page of the metadata endpoint of a station.
+    """
+    try:
+        url = f"{REST_URL_PATH}/metadata/facility/{code}/page/{page}"
+        response = _session.get(url)
+        response.raise_for_status()
+        return _json(response)
+    except HTTPError as http_err:
+        warnings.warn(f'HTTP error occurred while querying ACTRIS datasets for station={code}, page={page}: {http_err}')
+        raise
+    except Exception as err:
+        warnings.warn(f'Other error occurred while querying ACTRIS datasets for station={code}, page={page}: {err}')
+        raise
+
+
+def _fetch_datasets_for_station(code):
+    """
+    Walk the paginated metadata endpoint of a single station and return a list with all its datasets.
+    After the first page, further pages are fetched speculatively in parallel batches of doubling
+    size until an empty page marks the end of the pagination, so the total latency grows with the
+    number of batches instead of the number of pages.
+    Results are kept in an in-process TTL cache, so repeated queries for the same station
+    within _METADATA_EXPIRE_TIME are served without network traffic.
+    """
+    now = time.monotonic()
+    cached = _station_cache.get(code)
+    if cached is not None and now - cached[0] < _METADATA_EXPIRE_TIME:
+        return cached[1]
+
+    datasets = _fetch_page(code, 0)
+    if not datasets:
+        _station_cache[code] = (now, [])
+        return []
+
+    # the endpoint exposes no total count, but a page shorter than the first (full) page
+    # is necessarily the last one, which saves the final empty-page probe
+    page_size = len(datasets)
+    next_page = 1
+    batch_size = 1
+    with ThreadPoolExecutor(max_workers=_MAX_CONCURRENT_PAGES) as executor:
         while True:
-            try:
-                url = f"{REST_URL_PATH}/metadata/facility/{code}/page/{page}"
-                response = requests.get(url)
-                response.raise_for_status()
-                datasets = response.json()
-                
-                if not datasets:
+            pages = range(next_page, next_page + batch_size)
+            done = False
+            for page_datasets in executor.map(functools.partial(_fetch_page, code), pages):
+                if not page_datasets:
+                    done = True
+                    break
+                datasets.extend(page_datasets)
+                if len(page_datasets) < page_size:
+                    done = True
                     break
+            if done:
+                break
+            next_page += batch_size
+            batch_size = min(2 * batch_size, _MAX_CONCURRENT_PAGES)
+
+    _station_cache[code] = (now, datasets)
+    return datasets
+
+
+def query_datasets_stations(codes, variables_list=None, temporal_extent=None):
+    """
+    Query the ACTRIS database for metadata of datasets satisfying the specified criteria.
+    """
+    return list(iter_datasets_stations(codes, variables_list=variables_list, temporal_extent=temporal_extent))
 
-                all_datasets.extend(datasets)
-                page += 1
-            except HTTPError as http_err:
-                warnings.warn(f'HTTP error occurred while querying ACTRIS datasets for station={code}, page={page}: {http_err}')
-                raise
-            except Exception as err:
-                warnings.warn(f'Other error occurred while querying ACTRIS datasets for station={code}, page={page}: {err}')
-                raise
+
+def iter_datasets_stations(codes, variables_list=None, temporal_extent=None):
+    """
+    Like query_datasets_stations, but a generator: records are yielded as soon as each
+    station's page walk completes, so streaming consumers can start working before the
+    whole query finishes and peak memory stays bounded by one station's payload.
+    """
+    # drop duplicate codes while preserving order, so no station is fetched twice
+    codes = list(dict.fromkeys(codes))
+    if not codes:
+        return
+
+    variables_set = frozenset(variables_list) if variables_list is not None else None
+    temporal_bounds = tuple(map(pd.to_datetime, temporal_extent)) if temporal_extent is not None else None
+
+    # each station worker may issue up to _MAX_CONCURRENT_PAGES page fetches at
+    # once, so cap the station pool by the quotient to keep the total number of
+    # in-flight requests within _MAX_CONCURRENT_REQUESTS
+    max_workers = min(_MAX_CONCURRENT_REQUESTS // _MAX_CONCURRENT_PAGES, len(codes))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for code, datasets in zip(codes, executor.map(_fetch_datasets_for_station, codes)):
+            yield from _filter_station_datasets(code, datasets, variables_set, temporal_bounds)
+
+
+def _filter_station_datasets(code, datasets, variables_set, temporal_bounds):
+    """
+    Turn the raw datasets of a single station into the filtered list of ecv_dataset records.
+    """
+    # deduplicate with an order-preserving dict; the md2 API exposes no stable dataset id,
+    # so key on the dataset title (unique within a station)
+    datasets = list({dataset['md_identification']['title']: dataset for dataset in datasets}.values())
+
+    if temporal_bounds is not None and datasets:
+        # parse all time bounds in one batch and filter with a vectorized mask instead of
+        # two pd.to_datetime calls per dataset
+        t0, t1 = temporal_bounds
+        begins = pd.to_datetime([dataset['time_period'][0] for dataset in datasets])
+        ends = pd.to_datetime([dataset['time_period'][1] for dataset in datasets])
+        mask = (begins <= t1) & (ends >= t0)
+        # keep datasets with missing time bounds: NaT fails both comparisons, but
+        # the pre-vectorization filter only dropped datasets known to fall outside
+        # the window
+        mask |= begins.isna() | ends.isna()
+        datasets = [dataset for dataset, keep in zip(datasets, mask) if keep]
 
     all_ecv_dataset = []
 
-    for dataset in all_datasets:
-        if variables_list is not None:
-            _variables = set(variables_list)
-            if _variables.isdisjoint(dataset['ecv_variables']):
-                continue
+    for dataset in datasets:
+        # run the cheap rejection tests first, so title/url/time-period extraction is only
+        # paid for datasets which end up in the result
+        mapped_ecvs = _ecvs_for(frozenset(dataset['md_content_information']['attribute_descriptions']))
+        if not mapped_ecvs:
+            continue
 
-        if temporal_extent is not None:
-            t0, t1 = map(pd.to_datetime, temporal_extent)
-            if pd.to_datetime(dataset['time_period'][0]) > t1 or pd.to_datetime(dataset['time_period'][1]) < t0:
-                continue
+        if variables_set is not None and variables_set.isdisjoint(dataset['ecv_variables']):
+            continue
 
         title = dataset['md_identification']['title']
-        md_distribution_information = dataset['md_distribution_information']
 
         dataset_urls = [
             {'url': entry['dataset_url'], 'type': entry['protocol']}
-            for entry in md_distribution_information
-            if entry['protocol'] in ['OPeNDAP', 'HTTP']
+            for entry in dataset['md_distribution_information']
+            if entry['protocol'] in _ALLOWED_PROTOCOLS
         ]
 
-        attribute_descriptions = dataset['md_content_information']['attribute_descriptions']
-        
-        mapped_ecvs = []
-        for attribute in attribute_descriptions:
-            try:
-                ecv_names = MAPPING_ACTRIS_ECV[attribute]
-                mapped_ecvs.extend(ecv_names)
-            except KeyError:
-                pass
-        
-        # Make the list unique
-        mapped_ecvs = list(set(mapped_ecvs))
-        
-        platform_id = code
-
         time_period = [dataset['ex_temporal_extent']['time_period_begin'], dataset['ex_temporal_extent']['time_period_end']]
 
-        if mapped_ecvs:
-            ecv_dataset = {'title': title, 'urls': dataset_urls, 'layers': None, 'ecv_variables': mapped_ecvs, 'time_period': time_period, 'platform_id': platform_id}
-            all_ecv_dataset.append(ecv_dataset)
+        ecv_dataset = {'title': title, 'urls': dataset_urls, 'layers': None, 'ecv_variables': list(mapped_ecvs), 'time_period': time_period, 'platform_id': code}
+        all_ecv_dataset.append(ecv_dataset)
 
-    return list(all_ecv_dataset)
+    return all_ecv_dataset
 
 def read_dataset(dataset_id, variables_list=None):
     """
@@ -179,21 +353,35 @@ def read_dataset(dataset_id, variables_list=None):
     variables_set = set(variables_list) if variables_list is not None else None
     try:
         with xr.open_dataset(dataset_id) as ds:
-            varlist = []
-            for varname, da in ds.data_vars.items():
-                if 'ebas_component' not in da.attrs:
-                    continue
-                if variables_set is not None:
-                    
-                    ebas_name = da.attrs['ebas_component']
-                    ecv_names = MAPPING_ACTRIS_ECV.get(ebas_name, [])
-                    if ebas_name not in STATIC_PARAMETERS and variables_set.isdisjoint(ecv_names):
-                        continue
-                varlist.append(varname)
+            if variables_set is None:
+                varlist = [varname for varname, da in ds.data_vars.items() if 'ebas_component' in da.attrs]
+            else:
+                varlist = [
+                    varname for varname, da in ds.data_vars.items()
+                    if (ebas_name := da.attrs.get('ebas_component')) is not None
+                    and (ebas_name in STATIC_PARAMETERS
+                         or not variables_set.isdisjoint(MAPPING_ACTRIS_ECV_SETS.get(ebas_name, frozenset())))
+                ]
             return ds[varlist].load()
     except Exception as e:
         raise RuntimeError(f'Reading the ACTRIS dataset failed: {dataset_id}') from e
 
+
+def read_datasets(dataset_ids, variables_list=None):
+    """
+    Retrieves several datasets concurrently; the remote opens are independent and I/O-bound,
+    so they are dispatched through a thread pool instead of being paid one round trip at a time.
+    :param dataset_ids: list of str; identifiers (e.g. urls) of the datasets to retrieve
+    :param variables_list: list of str, optional; a list of ECV names
+    :return: list of xarray.Dataset objects, in the order of dataset_ids
+    """
+    if not dataset_ids:
+        return []
+    max_workers = min(_MAX_CONCURRENT_REQUESTS, len(dataset_ids))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(functools.partial(read_dataset, variables_list=variables_list), dataset_ids))
+
+
 if __name__ == "__main__":
     #print(get_list_platforms())
     #print(query_datasets_stations(['5qss']))
@@ -193,15 +193,21 @@ def read_dataset(dataset_id, variables_list=None):
     variables_set = set(variables_list) if variables_list is not None else None
     try:
         request_url = REST_URL_DOWNLOAD + "?fileId=" + dataset_id.replace("#", "%23")
-        response = requests.get(request_url)
+        response = requests.get(request_url, stream=True)
         response.raise_for_status()
-        with io.BytesIO(response.content) as buf:
+        # stream the body into the buffer; response.content would materialize the whole
+        # file as bytes first and io.BytesIO(initial_bytes) would then copy it again
+        buf = io.BytesIO()
+        for chunk in response.iter_content(chunk_size=1024 * 1024):
+            buf.write(chunk)
+        buf.seek(0)
+        with buf:
             with xr.open_dataset(buf, engine='h5netcdf') as ds:
-                _mean_vars = [v for v in ds if v.endswith('_mean')]
-                ds = ds[_mean_vars]
+                # select the wanted variables in a single attribute-only scan, so that just
+                # one dataset subset is built before loading
                 varlist = []
                 for varname, da in ds.data_vars.items():
-                    if 'standard_name' not in da.attrs:
+                    if not varname.endswith('_mean') or 'standard_name' not in da.attrs:
                         continue
                     if variables_set is not None:
                         std_name = da.attrs['standard_name']
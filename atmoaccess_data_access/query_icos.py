@@ -10,15 +10,22 @@ https://gcos.wmo.int/en/essential-climate-variables/pressure/ecv-requirements
 https://gcos.wmo.int/en/essential-climate-variables/ghg/ecv-requirements
 '''
 
+import functools
+import io
+import time
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import xarray as xr
 import warnings
 
-warnings.filterwarnings("ignore")
-
-from icoscp.station import station
-from icoscp.dobj import Dobj
-from icoscp.sparql.runsparql import RunSparql
+# icoscp is noisy at import time; silence it without installing a process-wide
+# "ignore" filter that would mask warnings from the consumer's other code
+with warnings.catch_warnings():
+    warnings.simplefilter('ignore')
+    from icoscp.station import station
+    from icoscp.dobj import Dobj
+    from icoscp.sparql.runsparql import RunSparql
 
 from . import helper
 
@@ -26,6 +33,30 @@ from . import helper
 # from icoscp.cpauth.authentication import Authentication
 # Authentication(token=ICOSCP_TOKEN)
 
+# the station list and the SPARQL catalog change rarely; keep them in an in-process
+# cache for this long (in seconds), so repeated queries skip the network round trips
+_CACHE_EXPIRE_TIME = 600
+_station_list_cache = None
+_sparql_cache = {}
+_query_datasets_cache = {}
+
+# on-disk copy of the unfiltered catalog, so a fresh process within the TTL can
+# warm-start from a local file instead of the SPARQL round trip
+_CATALOG_PATH = Path.home() / '.cache' / 'atmoaccess' / 'icos_catalog.pkl'
+
+
+def _get_station_list():
+    """
+    Return the ICOS station list dataframe, cached in-process with a TTL.
+    """
+    global _station_list_cache
+    now = time.monotonic()
+    if _station_list_cache is not None and now - _station_list_cache[0] < _CACHE_EXPIRE_TIME:
+        return _station_list_cache[1]
+    stations = station.getIdList(project='all')
+    _station_list_cache = (now, stations)
+    return stations
+
 
 # all stations info
 def get_list_platforms():
@@ -36,7 +67,7 @@ def get_list_platforms():
     stations : LIST[dicts]
     '''
 
-    stations = station.getIdList(project='all')
+    stations = _get_station_list()
 
     # remove ecosystem and ocean for this demonstrator
     # but, stations would contain ALL stations from ICOS
@@ -65,6 +96,28 @@ def _colname():
     return colname
 
 
+# the ICOS variable list is a fixed mapping for the moment (could / should be
+# dynamically queried); materialized once at import so get_list_variables only
+# copies it per call instead of rebuilding the literal
+_LIST_VARIABLES = [{'variable_name': 'AP', 'ECV_name': ['Pressure (surface)', 'Pressure', 'ap']},
+                   {'variable_name': 'WD', 'ECV_name': ['Surface Wind Speed and direction', 'wd']},
+                   {'variable_name': 'WS', 'ECV_name': ['Surface Wind Speed and direction', 'ws']},
+                   {'variable_name': 'AT', 'ECV_name': ['Temperature (near surface)', 'Temperature', 'at']},
+                   {'variable_name': 'RH',
+                    'ECV_name': ['Water Vapour (surface)', 'Water Vapour (Relative Humidity)', 'rh']},
+                   {'variable_name': 'co2',
+                    'ECV_name': ['Carbon Dioxide', 'Carbon Dioxide, Methane and other Greenhouse gases',
+                                 'Tropospheric CO2', 'co2']},
+                   {'variable_name': 'co',
+                    'ECV_name': ['Carbon Monoxide', 'Carbon Dioxide, Methane and other Greenhouse gases', 'co']},
+                   {'variable_name': 'ch4',
+                    'ECV_name': ['Methane', 'Carbon Dioxide, Methane and other Greenhouse gases', 'Tropospheric CH4',
+                                 'ch4']},
+                   {'variable_name': 'n2o',
+                    'ECV_name': ['Nitrous Oxide', 'Carbon Dioxide, Methane and other Greenhouse gases', 'n2o']}
+                   ]
+
+
 def get_list_variables():
     """
     Return a list of Variables from ICOS for the moment this is a
@@ -73,25 +126,8 @@ def get_list_variables():
     -------
     variables : LIST[dicts]
     """
-
-    variables = [{'variable_name': 'AP', 'ECV_name': ['Pressure (surface)', 'Pressure', 'ap']},
-                 {'variable_name': 'WD', 'ECV_name': ['Surface Wind Speed and direction', 'wd']},
-                 {'variable_name': 'WS', 'ECV_name': ['Surface Wind Speed and direction', 'ws']},
-                 {'variable_name': 'AT', 'ECV_name': ['Temperature (near surface)', 'Temperature', 'at']},
-                 {'variable_name': 'RH',
-                  'ECV_name': ['Water Vapour (surface)', 'Water Vapour (Relative Humidity)', 'rh']},
-                 {'variable_name': 'co2',
-                  'ECV_name': ['Carbon Dioxide', 'Carbon Dioxide, Methane and other Greenhouse gases',
-                               'Tropospheric CO2', 'co2']},
-                 {'variable_name': 'co',
-                  'ECV_name': ['Carbon Monoxide', 'Carbon Dioxide, Methane and other Greenhouse gases', 'co']},
-                 {'variable_name': 'ch4',
-                  'ECV_name': ['Methane', 'Carbon Dioxide, Methane and other Greenhouse gases', 'Tropospheric CH4',
-                               'ch4']},
-                 {'variable_name': 'n2o',
-                  'ECV_name': ['Nitrous Oxide', 'Carbon Dioxide, Methane and other Greenhouse gases', 'n2o']}
-                 ]
-    return variables
+    # a per-call copy, so callers mutating the result cannot corrupt the constant
+    return [dict(v, ECV_name=list(v['ECV_name'])) for v in _LIST_VARIABLES]
 
 
 def ecv_icos_map():
@@ -102,54 +138,73 @@ def ecv_icos_map():
     return reverse
 
 
+# lower-cased ICOS variable name -> SPARQL spec URI, built once at import
+_VAR_LOWER_TO_SPEC = {
+    'ap': 'http://meta.icos-cp.eu/resources/cpmeta/atcMtoL2DataObject',
+    'wd': 'http://meta.icos-cp.eu/resources/cpmeta/atcMtoL2DataObject',
+    'ws': 'http://meta.icos-cp.eu/resources/cpmeta/atcMtoL2DataObject',
+    'at': 'http://meta.icos-cp.eu/resources/cpmeta/atcMtoL2DataObject',
+    'rh': 'http://meta.icos-cp.eu/resources/cpmeta/atcMtoL2DataObject',
+    'co2': 'http://meta.icos-cp.eu/resources/cpmeta/atcCo2Product',  # 'http://meta.icos-cp.eu/resources/cpmeta/atcCo2L2DataObject',
+    'co': 'http://meta.icos-cp.eu/resources/cpmeta/atcCoL2DataObject',
+    'ch4': 'http://meta.icos-cp.eu/resources/cpmeta/atcCh4Product',  # 'http://meta.icos-cp.eu/resources/cpmeta/atcCh4L2DataObject',
+    'n2o': 'http://meta.icos-cp.eu/resources/cpmeta/atcN2oL2DataObject',
+}
+
+
 def __get_spec(variable_name):
     """
-    Return a list of Variables from ICOS for the moment this is a
-    fixed dictionary, but could / should be dynamically queried
-    Returns
-    -------
-    variables : LIST[dicts]
+    Return the SPARQL spec URI for an ICOS variable name, or '' if unknown.
     """
-
     # make sure variable_name is lower case
-    variable_name = variable_name.lower()
-    specs = {'ap': 'http://meta.icos-cp.eu/resources/cpmeta/atcMtoL2DataObject',
-             'wd': 'http://meta.icos-cp.eu/resources/cpmeta/atcMtoL2DataObject',
-             'ws': 'http://meta.icos-cp.eu/resources/cpmeta/atcMtoL2DataObject',
-             'at': 'http://meta.icos-cp.eu/resources/cpmeta/atcMtoL2DataObject',
-             'rh': 'http://meta.icos-cp.eu/resources/cpmeta/atcMtoL2DataObject',
-             'co2': 'http://meta.icos-cp.eu/resources/cpmeta/atcCo2Product', #'http://meta.icos-cp.eu/resources/cpmeta/atcCo2L2DataObject',
-             'co': 'http://meta.icos-cp.eu/resources/cpmeta/atcCoL2DataObject',
-             'ch4': 'http://meta.icos-cp.eu/resources/cpmeta/atcCh4Product', #'http://meta.icos-cp.eu/resources/cpmeta/atcCh4L2DataObject',
-             'n2o': 'http://meta.icos-cp.eu/resources/cpmeta/atcN2oL2DataObject'
-             }
-    if variable_name in specs.keys():
-        return specs[variable_name]
-    else:
-        return ''
+    return _VAR_LOWER_TO_SPEC.get(variable_name.lower(), '')
+
+
+# spec URI -> ECV names, built once at import so per-row lookups in the
+# query_datasets output loop are plain dict reads
+_SPEC_TO_ECVS = {
+    'http://meta.icos-cp.eu/resources/cpmeta/atcMtoL2DataObject': ['Pressure (surface)',
+                                                                   'Surface Wind Speed and direction',
+                                                                   'Temperature (near surface)',
+                                                                   'Water Vapour (surface)'],
+    'http://meta.icos-cp.eu/resources/cpmeta/atcCo2Product': ['Carbon Dioxide'],
+    # 'http://meta.icos-cp.eu/resources/cpmeta/atcCo2L2DataObject': ['Carbon Dioxide'],
+    'http://meta.icos-cp.eu/resources/cpmeta/atcCoL2DataObject': ['Carbon Monoxide'],
+    'http://meta.icos-cp.eu/resources/cpmeta/atcCh4L2Product': ['Methane'],
+    'http://meta.icos-cp.eu/resources/cpmeta/atcCh4Product': ['Methane'],  # WOLP: this key seemed to be missing
+    # 'http://meta.icos-cp.eu/resources/cpmeta/atcCh4L2DataObject': ['Methane'],
+    'http://meta.icos-cp.eu/resources/cpmeta/atcN2oL2DataObject': ['Nitrous Oxide'],
+}
 
 
 def __get_ecv(spec):
-    ecvar = {'http://meta.icos-cp.eu/resources/cpmeta/atcMtoL2DataObject': ['Pressure (surface)', \
-                                                                            'Surface Wind Speed and direction', \
-                                                                            'Temperature (near surface)', \
-                                                                            'Water Vapour (surface)'],
-             'http://meta.icos-cp.eu/resources/cpmeta/atcCo2Product': ['Carbon Dioxide'],
-             # 'http://meta.icos-cp.eu/resources/cpmeta/atcCo2L2DataObject': ['Carbon Dioxide'],
-             'http://meta.icos-cp.eu/resources/cpmeta/atcCoL2DataObject': ['Carbon Monoxide'],
-             'http://meta.icos-cp.eu/resources/cpmeta/atcCh4L2Product': ['Methane'],
-             'http://meta.icos-cp.eu/resources/cpmeta/atcCh4Product': ['Methane'], # WOLP: this key seemed to be missing
-             # 'http://meta.icos-cp.eu/resources/cpmeta/atcCh4L2DataObject': ['Methane'],
-             'http://meta.icos-cp.eu/resources/cpmeta/atcN2oL2DataObject': ['Nitrous Oxide']
-             }
-
-    if spec in ecvar.keys():
-        return ecvar[spec]
+    if spec in _SPEC_TO_ECVS:
+        return _SPEC_TO_ECVS[spec]
     else:
         print(f'__get_ecv: key={spec} not found')
         return ''
 
 
+# inverted index built once at import: lower-cased ECV alias -> set of SPARQL spec
+# URIs, so query_datasets resolves the requested variables with dict lookups
+# instead of a nested scan over the variable list on every call
+_ECV_LOWER_TO_SPECS = {}
+for _vv in get_list_variables():
+    _spec = __get_spec(_vv['variable_name'])
+    if _spec:
+        for _ecv in _vv['ECV_name']:
+            _ECV_LOWER_TO_SPECS.setdefault(_ecv.lower(), set()).add(_spec)
+del _vv, _spec, _ecv
+
+# lower-cased ECV alias -> lower-cased ICOS variable names, used by read_dataset
+# to project the dataframe columns before the xarray conversion
+_ECV_LOWER_TO_ICOS_VARS = {}
+for _vv in get_list_variables():
+    for _ecv in _vv['ECV_name']:
+        _ECV_LOWER_TO_ICOS_VARS.setdefault(_ecv.lower(), set()).add(_vv['variable_name'].lower())
+del _vv, _ecv
+
+
 def query_datasets(variables=[], temporal=[], spatial=[]):
     """
     return identifiers for datasets constraint by input parameters.
@@ -178,47 +233,50 @@ def query_datasets(variables=[], temporal=[], spatial=[]):
     platform_id: id of the station (i.e. identical to short_name of the platform return by method get_list_platforms())
     If there are no results an empty list is returned
     """
-    stn = station.getIdList(project='all')
-    stn = stn[(stn['theme'] == 'AS')] #& (stn['icosClass'].isin(['1', '2', 'Associated']))]
-    dtypes = ['str', 'str', 'str', 'str', 'float', 'float', 'float', 'str', 'str']
-    dtype = dict(zip(stn.columns.tolist(), dtypes))
-    # get all datasets and convert dtype
-    dataset = __sparql_data()
-    dtypes = ['str', 'str', 'str', 'str', 'int', 'datetime64', 'datetime64', 'datetime64']
-    dtype = dict(zip(dataset.columns.tolist(), dtypes))
-    dataset.astype(dtype)
-
-    # start filtering according to parameters
-    selected_var = []
-    for vv in get_list_variables():
-        # convert all to lowercase, for more resilience
-        ecv = [v.lower() for v in vv['ECV_name']]
-        for v in variables:
-            if v.lower() in ecv:
-                selected_var.append(vv['variable_name'])
-
-    # make sure there are no duplicates
-    selected_var = list(set(selected_var))
-
-    df = pd.DataFrame()
-
-    # filter provided variables from all datasets
-    for v in selected_var:
-        data = dataset[dataset['spec'] == __get_spec(v)]
-        df = df.append(data)
+    # identical queries recur during interactive exploration; serve them from a
+    # TTL cache keyed on the normalized arguments, bypassing SPARQL, filtering
+    # and the per-dataset title lookups altogether
+    cache_key = (tuple(variables), tuple(temporal), tuple(spatial))
+    now = time.monotonic()
+    cached = _query_datasets_cache.get(cache_key)
+    if cached is not None and now - cached[0] < _CACHE_EXPIRE_TIME:
+        return list(cached[1])
+    result = _query_datasets(variables, temporal, spatial)
+    _query_datasets_cache[cache_key] = (time.monotonic(), result)
+    # a shallow copy, so callers mutating the returned list do not corrupt the cache
+    return list(result)
+
+
+def _query_datasets(variables, temporal, spatial):
+    # get all datasets and parse the time columns; cache=True deduplicates the
+    # string parsing, which pays off since the catalog timestamps cluster on
+    # day boundaries (idempotent on a cache hit, where they are parsed already)
+    dataset = __sparql_data(temporal if len(temporal) == 2 else None)
+    for col in ['submTime', 'timeStart', 'timeEnd']:
+        dataset[col] = pd.to_datetime(dataset[col], utc=True, cache=True)
+
+    # start filtering according to parameters: resolve the requested variables
+    # (lower-cased, for more resilience) to spec URIs via the inverted index
+    wanted_specs = set().union(*(_ECV_LOWER_TO_SPECS.get(v.lower(), ()) for v in variables))
+
+    # filter provided variables from all datasets in one vectorized pass; selecting
+    # by spec at once cannot produce duplicate rows (meteo variables share the same
+    # file and hence the same spec), so no drop_duplicates is needed afterwards
+    df = dataset[dataset['spec'].isin(wanted_specs)]
 
     if df.empty:
         return []
 
-    # make sure there are no duplicates (meteo variables are in the same file)
-    df = df.drop_duplicates(subset=['dobj'])
-
     # filter temporal
     if len(temporal) == 2:
-        df = df[(df.timeStart <= temporal[1]) & (df.timeEnd >= temporal[0])]
+        t0, t1 = (pd.to_datetime(t, utc=True) for t in temporal)
+        df = df[(df.timeStart <= t1) & (df.timeEnd >= t0)]
 
-    # filter spatial
+    # filter spatial; the station list is only needed to resolve the bounding box,
+    # so fetch it here rather than unconditionally at the top of the function
     if len(spatial) == 4:
+        stn = _get_station_list()
+        stn = stn[(stn['theme'] == 'AS')] #& (stn['icosClass'].isin(['1', '2', 'Associated']))]
         stlist = []
         for s in df.station.unique().tolist():
             # find stations within bounding box
@@ -244,29 +302,46 @@ def query_datasets(variables=[], temporal=[], spatial=[]):
     # transfrom pandas dataframe to dict to conform for envri
     # fair demonstrator
 
-    # add platform_id
-    ids = df.station.to_list()
-    ids = [s[-3:] for s in ids]
-    df['platform_id'] = ids
+    # add platform_id: the station URIs end in the 3-letter station code
+    df['platform_id'] = df['station'].str[-3:]
 
     outlist = []
     import data_processing
-    for r in df.iterrows():
+
+    # the per-dataset title lookups are independent HTTP round trips; issue them in
+    # parallel instead of paying one RTT per row
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        titles = list(executor.map(
+            lambda dobj: data_processing.GetICOSDatasetTitleRequest(dobj).compute(),
+            df['dobj'].tolist()
+        ))
+
+    for r, title in zip(df.itertuples(index=False), titles):
         d = {
-            'title': data_processing.GetICOSDatasetTitleRequest(r[1].dobj).compute(),  
-            'file_name': r[1].fileName,
-            'urls': [{'url': r[1].dobj, 'type': 'landing_page'}],
-            'ecv_variables': __get_ecv(r[1].spec),
-            'time_period': [r[1].timeStart, r[1].timeEnd],
-            'platform_id': r[1].platform_id,
+            'title': title,
+            'file_name': r.fileName,
+            'urls': [{'url': r.dobj, 'type': 'landing_page'}],
+            # copy, so callers mutating a record cannot corrupt the module
+            # constant (or cached query results built from it)
+            'ecv_variables': list(_SPEC_TO_ECVS[r.spec]),
+            'time_period': [r.timeStart, r.timeEnd],
+            'platform_id': r.platform_id,
         }
         outlist.append(d)
     return outlist
 
 
-def __sparql_data():
+def __sparql_data(temporal=None):
+    # push the time-window filter into the query so the server prunes rows before
+    # they are transferred and parsed; the query text doubles as the cache key, so
+    # each window is cached separately
+    time_filter = ''
+    if temporal is not None and len(temporal) == 2:
+        t0, t1 = (pd.to_datetime(t, utc=True).strftime('%Y-%m-%dT%H:%M:%SZ') for t in temporal)
+        time_filter = 'FILTER (?timeStart <= "%s"^^xsd:dateTime && ?timeEnd >= "%s"^^xsd:dateTime)' % (t1, t0)
     q = """	   prefix cpmeta: <http://meta.icos-cp.eu/ontologies/cpmeta/>
      prefix prov: <http://www.w3.org/ns/prov#>
+     prefix xsd: <http://www.w3.org/2001/XMLSchema#>
     	select ?station ?dobj ?spec ?fileName ?size ?submTime ?timeStart ?timeEnd
     	where {
         		VALUES ?spec {
@@ -282,6 +357,7 @@ def __sparql_data():
         	?dobj cpmeta:wasSubmittedBy/prov:endedAtTime ?submTime .
         	?dobj cpmeta:hasStartTime | (cpmeta:wasAcquiredBy / prov:startedAtTime) ?timeStart .
         	?dobj cpmeta:hasEndTime | (cpmeta:wasAcquiredBy / prov:endedAtTime) ?timeEnd .
+        	%s
         	FILTER NOT EXISTS {[] cpmeta:isNextVersionOf ?dobj}
         	{
         		{FILTER NOT EXISTS {?dobj cpmeta:hasVariableName ?varName}}
@@ -292,21 +368,72 @@ def __sparql_data():
         		}
         	}
         }
-    """
-    sparql = RunSparql(q, output_format='pandas').run()
-
+    """ % time_filter
+    now = time.monotonic()
+    cached = _sparql_cache.get(q)
+    if cached is not None and now - cached[0] < _CACHE_EXPIRE_TIME:
+        return cached[1]
+
+    # warm start: reuse the catalog persisted by an earlier process, if fresh
+    # enough (only the unfiltered catalog is persisted); stale or unreadable
+    # files just fall through to the network fetch
+    if not time_filter:
+        try:
+            if time.time() - _CATALOG_PATH.stat().st_mtime < _CACHE_EXPIRE_TIME:
+                sparql = pd.read_pickle(_CATALOG_PATH)
+                _sparql_cache[q] = (now, sparql)
+                return sparql
+        except Exception:
+            pass
+
+    # fetch the results as CSV and parse them with pandas' C parser, which is
+    # much faster than icoscp's row-by-row conversion of the 'pandas' format
+    sparql = pd.read_csv(io.StringIO(RunSparql(q, output_format='csv').run()))
+
+    if not time_filter:
+        try:
+            _CATALOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+            sparql.to_pickle(_CATALOG_PATH)
+        except OSError:
+            pass
+
+    _sparql_cache[q] = (now, sparql)
     return sparql
 
 
-def read_dataset(pid):
-    digital_object = Dobj(pid)
+@functools.lru_cache(maxsize=32)
+def _get_digital_object(pid):
+    """
+    Return the Dobj for pid, cached: ICOS data objects are immutable per pid
+    (a new version gets a new pid) and Dobj keeps its payload once fetched, so
+    repeated reads of the same pid skip the HTTPS download and parse.
+    """
+    return Dobj(pid)
+
+
+def read_dataset(pid, variables_list=None):
+    digital_object = _get_digital_object(pid)
     # Get data & meta-data of the digital object.
     data_df, meta_data = digital_object.data, digital_object.info
     # In case of empty data or meta-data return an empty dataset.
     if data_df is None or meta_data is None:
         return xr.Dataset()
-    # Initiate a dataset from the `data_df` dataframe.
-    dataset = xr.Dataset.from_dataframe(data_df)
+    # Project the requested variables on the dataframe before the xarray
+    # conversion, so columns that would be dropped anyway are never wrapped
+    # into DataArrays. Time-stamp columns are always kept.
+    if variables_list is not None:
+        wanted = {iv for v in variables_list for iv in _ECV_LOWER_TO_ICOS_VARS.get(v.lower(), ())}
+        cols = [c for c in data_df.columns
+                if c.lower() in wanted or 'time' in c.lower()]
+        data_df = data_df[cols]
+    # Initiate a dataset from the `data_df` dataframe. The columns are wrapped
+    # directly as variables over a common 'index' dimension; Dataset.from_dataframe
+    # would go through an index/unstack path that allocates intermediates we do
+    # not need for a flat dataframe.
+    dataset = xr.Dataset(
+        {col: ('index', data_df[col].values) for col in data_df.columns},
+        coords={'index': data_df.index.values},
+    )
 
     # setup global attributes
     dobj_station = getattr(digital_object, 'station', None)
@@ -322,8 +449,11 @@ def read_dataset(pid):
 
     # Loop over the variables in the meta-data.
     for variable_dict in meta_data['specificInfo']['columns']:
-        attributes = dict()
         variable_name = variable_dict['label']
+        # The meta-data may describe columns projected away above.
+        if variable_name not in dataset:
+            continue
+        attributes = dict()
         # Extract 'label' meta-data.
         attributes['label'] = variable_dict['valueType']['self']['label']
         # Some variables do not come with units.
@@ -332,8 +462,9 @@ def read_dataset(pid):
             attributes['units'] = variable_dict['valueType']['unit']
         # Update the variables' attributes of the initialized dataset
         # in-place. Each extracted meta-data value will be a new
-        # attribute under the corresponding variable.
-        dataset[variable_name] = dataset[variable_name].assign_attrs(attributes)
+        # attribute under the corresponding variable. Mutating attrs
+        # directly avoids the DataArray copy assign_attrs would make.
+        dataset[variable_name].attrs.update(attributes)
     return dataset
 
 